@@ -1,11 +1,19 @@
 #!/usr/bin/env python3
 
+import os
 import csv
 import sys
 import re
+import json
+import heapq
+import unicodedata
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+from tempfile import TemporaryFile, TemporaryDirectory
 from unittest import TestLoader, TextTestRunner, TestCase
 from argparse import ArgumentParser, FileType
-from io import TextIOWrapper
+from io import TextIOWrapper, BytesIO, StringIO
 
 # Process a SCPA Scores Collection CSV file:
 #
@@ -19,10 +27,17 @@ fieldnames = ['id', 'composer', 'title', 'imprint', 'instrumentation',
               'duration', 'solo_difficulty', 'difficulty', 'pages',
               'ensemble_description', 'special', 'ensemble_size', 'fair_use']
 
+# Number of rows sorted in memory when merging several input files
+default_run_size = 20000
+
+# Highest number of spilled runs merged at once, to bound the open files
+merge_fan_in = 100
+
 new_fieldnames = ['collection_dictionary', 'collection_sorted_dictionary',
                   'instrumentation_dictionary',
                   'instrumentation_dictionary_full',
-                  'instrumentation_dictionary_full_with_alt']
+                  'instrumentation_dictionary_full_with_alt',
+                  'composer_sort', 'title_sort']
 
 collection_dict = {
     "ICA": "International Clarinet Association (ICA) Score Collection",
@@ -203,11 +218,116 @@ inst_dict = {
     "ens": "ensemble"
 }
 
+# Full names of the instrument codes, the only instrumentation_dictionary
+# values suggested for autocomplete
+inst_labels = set(inst_dict.values())
+
+# Placeholder for an empty title
+missing_title = "missing title"
+
+# Order of preference of the suggestion sources, for terms in several
+suggestion_sources = ['composer', 'title', 'instrumentation']
+
 p_multipipe = re.compile(r'\|+')
 p_multispace = re.compile(r' *\| *')
 p_trailingpipe = re.compile(r'\|$')
 p_inst = re.compile(r'([\w-]+?) *\( *([0-9]+|ens|opt) *\)')
 
+# Sort keys
+p_sort_leading = re.compile(r'^[\W_]+')
+p_sort_article = re.compile(r"^(?:l' *|(?:the|an?|les?|la|une?|der|die|" +
+                            r"das|eine?|il|lo|gli|uno|el|los|las) )")
+p_sort_comma = re.compile(r' *, *')
+
+# Replacements for characters without an ASCII decomposition, or with a
+# misleading one, eg NFKD folds '3½' to '312'
+sort_fold_extra = {
+    'ß': 'ss', 'æ': 'ae', 'Æ': 'AE', 'œ': 'oe', 'Œ': 'OE',
+    'ø': 'o', 'Ø': 'O', 'ł': 'l', 'Ł': 'L', 'đ': 'd', 'Đ': 'D',
+    'ð': 'd', 'Ð': 'D', 'þ': 'th', 'Þ': 'TH', 'ı': 'i',
+    '‘': "'", '’': "'", '‚': "'", '“': '"', '”': '"', '„': '"',
+    '´': "'", '–': '-', '—': '-', '…': '...', '×': 'x', '⁄': '/',
+    '¼': ' 1/4', '½': ' 1/2', '¾': ' 3/4', '⅓': ' 1/3', '⅔': ' 2/3',
+    '⅛': ' 1/8', '⅜': ' 3/8', '⅝': ' 5/8', '⅞': ' 7/8',
+}
+
+
+def get_sort_fold_table():
+    '''
+    Build the str.translate table folding the Latin, combining and general
+    punctuation characters to ASCII, once, so sort keys are folded with a
+    table lookup per character.
+    '''
+
+    table = {}
+
+    for code in list(range(0x80, 0x370)) + list(range(0x1e00, 0x2070)):
+        char = chr(code)
+        folded = unicodedata.normalize('NFKD', char)
+        folded = folded.encode('ascii', 'ignore').decode('ascii')
+        if folded != char:
+            table[code] = folded
+
+    table.update((ord(char), folded)
+                 for char, folded in sort_fold_extra.items())
+
+    return table
+
+
+sort_fold_table = get_sort_fold_table()
+
+
+def get_sort_key(value):
+    '''
+    Get the common part of a sort key: ASCII folded, lower case, without
+    leading punctuation and with single spaces.
+    '''
+
+    # Most values are already ASCII, and isascii() is much cheaper than a
+    # translate() that changes nothing
+    if not value.isascii():
+        value = value.translate(sort_fold_table)
+
+        # Drop what the table does not cover, eg mis-encoded characters
+        if not value.isascii():
+            value = value.encode('ascii', 'ignore').decode('ascii')
+
+    value = ' '.join(value.lower().replace('|', ' ').split())
+
+    if not value[:1].isalnum():
+        value = p_sort_leading.sub('', value)
+
+    return value
+
+
+def get_composer_sort(composer):
+    ''' Get the composer_sort key, for "Last, First" names. '''
+
+    key = get_sort_key(composer)
+
+    # Spaces are already single, so only these need the substitution
+    if ' ,' in key or key.count(',') != key.count(', '):
+        key = p_sort_comma.sub(', ', key)
+
+    return key
+
+
+def get_title_sort(title):
+    ''' Get the title_sort key, without a leading article. '''
+
+    key = get_sort_key(title)
+
+    match = p_sort_article.match(key)
+    if match is None:
+        return key
+
+    without_article = key[match.end():]
+    if not without_article[:1].isalnum():
+        without_article = p_sort_leading.sub('', without_article)
+
+    # Keep titles which are only an article, eg "Die"
+    return without_article or key
+
 
 def inst_sort_key(obj):
     '''
@@ -377,138 +497,662 @@ def get_instrument_fields(inst_values):
     return id, idf, idfwa
 
 
+def clean_row(row, all_ids, report):
+    '''
+    Cleanup and validate a single input row in place, and generate the new
+    fields. all_ids holds the ids seen so far, for the uniqueness check.
+
+    Validation problems are passed to report(type, id, field, msg), with type
+    'error' or 'warn'.
+    '''
+
+    id = "?"
+
+    def error(field, msg):
+        report('error', id, field, msg)
+
+    def warn(field, msg):
+        report('warn', id, field, msg)
+
+    # Iterate over the fields in each row
+    for field in fieldnames:
+
+        new_value = row[field]
+
+        # Ensure we have the column
+        if new_value is None:
+            error(field, "field value is missing")
+            break
+
+        if field == 'id':
+            id = row['id']
+
+            try:
+                # strip out BOM
+                id = id.replace('\ufeff', '')
+
+                id = int(id)
+                if id < 1:
+                    raise ValueError(f'not a positive integer: {id}')
+
+                # Zero pad id to 8 digits
+                id = f"{int(id):08}"
+
+                if id in all_ids:
+                    raise ValueError(f'not unique: {id}')
+
+                all_ids.add(id)
+                new_value = id
+
+            except ValueError as err:
+                id = "?"
+                error(f'id', str(err))
+
+        else:
+
+            # Replace Control character K (represents multiple values)
+            # with PIPE
+            new_value = new_value.replace('\v', '|')
+
+            # Replace multiple PIPEs with single PIPE
+            # (To get rid of empty values in a multivalued field
+            new_value = p_multipipe.sub('|', new_value)
+
+            # Trim extra spaces between values in a multivalued field
+            new_value = p_multispace.sub('|', new_value)
+
+            # Trim extra space between fields
+            new_value = new_value.strip()
+
+            # Remove trailing PIPE in a field
+            new_value = p_trailingpipe.sub('', new_value)
+
+        if field == 'composer':
+            row['composer_sort'] = get_composer_sort(new_value)
+
+        if field == 'title':
+            row['title_sort'] = get_title_sort(new_value)
+
+            if new_value == "":
+                new_value = missing_title
+                error('title', 'is empty')
+
+        if field == 'collection':
+            if new_value in collection_dict:
+                csd = collection_dict[new_value]
+                # cd = csd.split('::')[1]
+                cd = csd
+            else:
+                csd, cd = '', ''
+                if new_value != "":
+                    error('collection', f'unknown value: {new_value}')
+
+            # add new fields
+            row['collection_dictionary'] = cd
+            row['collection_sorted_dictionary'] = csd
+
+        if field == 'instrumentation':
+
+            if new_value != "":
+
+                # Parse the instrument list, splitting on ',' and their
+                # alternatives on '|'.
+                inst_values = parse_inst_list(new_value)
+
+                # Check for known values
+                for alt in inst_values:
+                    for inst, _ in alt:
+                        if inst not in inst_dict:
+                            warn('instrumentation',
+                                 f'unknown value: {inst}')
+
+                field_id, field_idf, field_idfwa = \
+                    get_instrument_fields(inst_values)
+
+                row['instrumentation_dictionary'] = \
+                    ','.join(field_id)
+
+                row['instrumentation_dictionary_full'] = \
+                    ','.join(field_idf)
+
+                row['instrumentation_dictionary_full_with_alt'] = \
+                    ','.join(field_idfwa)
+
+        row[field] = new_value
+
+
+def get_suggestions(row):
+    '''
+    Get the autocomplete suggestions of a cleaned row, as (term, source)
+    tuples: the composers, the title without its subtitles and the
+    instrumentation_dictionary labels resolved from inst_dict. Unknown
+    instrument codes and the missing title placeholder are left out, and
+    fields left as None by a short row are skipped.
+    '''
+
+    for composer in (row.get('composer') or '').split('|'):
+        if composer != "":
+            yield composer, 'composer'
+
+    title = (row.get('title') or '').split('|')[0]
+    if title != "" and title != missing_title:
+        yield title, 'title'
+
+    for name in (row.get('instrumentation_dictionary') or '').split(','):
+        if name in inst_labels:
+            yield name, 'instrumentation'
+
+
+def write_suggestions(f, suggestions):
+    '''
+    Write the suggestion dictionary, one "term<TAB>weight<TAB>source" entry
+    per line, sorted by term ignoring case. This is the format of the Solr
+    FileDictionaryFactory, with the source as payload.
+
+    Each term is written once: the weight is the number of rows with the
+    term, from all sources, and the source is the one with the most rows.
+    '''
+
+    terms = {}
+
+    for (term, source), weight in suggestions.items():
+        # A line break or tab would split the dictionary line
+        term = ' '.join(term.split())
+        if term == '':
+            continue
+        terms.setdefault(term, Counter())[source] += weight
+
+    for term in sorted(terms, key=lambda term: (term.casefold(), term)):
+        sources = terms[term]
+        source = min(sources, key=lambda source: (
+            -sources[source], suggestion_sources.index(source)))
+
+        f.write(f'{term}\t{sum(sources.values())}\t{source}\n')
+
+
+def read_input(infile, index=None):
+    '''
+    Iterate over the rows of an input file as (rownum, row), skipping the
+    header.
+
+    With an index dict, the rows are read from the binary file instead, and
+    the row index is filled as they are read; see read_indexed().
+    '''
+
+    if index is None:
+        reader = csv.DictReader(TextIOFilter(infile), fieldnames=fieldnames)
+        rows = enumerate(reader, start=1)
+    else:
+        rows = read_indexed(infile.name, index)
+
+    for rownum, row in rows:
+
+        # Skip the header
+        if 'Column1' in row['id']:
+            continue
+
+        yield rownum, row
+
+
+def get_merge_key(filenum, rownum, row):
+    '''
+    Get the merge order of an input row: by id, then by input file and row
+    number. Rows with an invalid id go last, in input order.
+    '''
+
+    id = normalize_id(row['id'])
+    if id is None:
+        return (1, 0, filenum, rownum)
+
+    return (0, int(id), filenum, rownum)
+
+
+def write_run(run):
+    ''' Spill a sorted run of (key, row) to a temporary file. '''
+
+    f = TemporaryFile('w+', encoding='UTF-8')
+
+    # JSON keeps the None values of missing and extra columns
+    for key, row in run:
+        json.dump([key, [row[field] for field in fieldnames], row.get(None)],
+                  f)
+        f.write('\n')
+
+    f.seek(0)
+    return f
+
+
+def read_run(f):
+    ''' Read back a run spilled by write_run(), as (key, row). '''
+
+    with f:
+        for line in f:
+            key, values, extra = json.loads(line)
+
+            row = dict(zip(fieldnames, values))
+            if extra is not None:
+                row[None] = extra
+
+            yield tuple(key), row
+
+
+def merge_runs(runs):
+    ''' Merge spilled runs into a single spilled run, closing them. '''
+
+    return write_run(heapq.merge(*map(read_run, runs), key=itemgetter(0)))
+
+
+def spill_run(levels, run):
+    '''
+    Add a spilled run to the levels of runs waiting to be merged. When a
+    level holds merge_fan_in runs, they are merged into one run of the next
+    level, so each row is merged once per level and the number of open runs
+    stays below merge_fan_in per level.
+    '''
+
+    for level in levels:
+        level.append(run)
+        if len(level) < merge_fan_in:
+            return
+
+        run = merge_runs(level)
+        level.clear()
+
+    levels.append([run])
+
+
+def merge_inputs(infiles, run_size=default_run_size, index=None):
+    '''
+    Merge the rows of the input files in one streaming pass, ordered by id,
+    as (key, row); see get_merge_key(). The rows are sorted in runs of
+    run_size rows, and all runs but the last are spilled to temporary files
+    and merged in passes of at most merge_fan_in runs. Memory is bounded by
+    run_size rows plus one row per open run, and the open files by
+    merge_fan_in per level, ie per factor of merge_fan_in in the number of
+    runs.
+
+    With an index dict and a single input file, the row index is filled as
+    the file is read; see read_input().
+    '''
+
+    if len(infiles) > 1:
+        index = None
+
+    levels, run = [], []
+
+    for filenum, infile in enumerate(infiles):
+        for rownum, row in read_input(infile, index):
+            run.append((get_merge_key(filenum, rownum, row), row))
+
+            if len(run) >= run_size:
+                run.sort(key=itemgetter(0))
+                spill_run(levels, write_run(run))
+                run = []
+
+    runs = [spilled for level in levels for spilled in level]
+
+    # Final pass, over less than merge_fan_in runs
+    while len(runs) >= merge_fan_in:
+        runs = runs[merge_fan_in:] + [merge_runs(runs[:merge_fan_in])]
+
+    run.sort(key=itemgetter(0))
+
+    return heapq.merge(*map(read_run, runs), iter(run), key=itemgetter(0))
+
+
+def resolve_duplicates(merged, policy):
+    '''
+    Apply the duplicate id policy to the merged (key, row), where the rows
+    with the same id are adjacent:
+      error - keep all the rows, the uniqueness check reports the duplicates
+      first - keep the row from the first input file
+      last  - keep the row from the last input file
+
+    Yield (filenum, rownum, row, dropped), with the (filenum, rownum) of the
+    dropped rows.
+    '''
+
+    for (invalid, _), group in groupby(merged, key=lambda x: x[0][:2]):
+        if invalid or policy == 'error':
+            for key, row in group:
+                yield key[2], key[3], row, []
+            continue
+
+        group = list(group)
+        key, row = group[0] if policy == 'first' else group[-1]
+        dropped = [other[0][2:] for other in group if other[0] != key]
+
+        yield key[2], key[3], row, dropped
+
+
 def cleanup():
     ''' Main loop for cleanup and validation. '''
 
-    def error(field, msg):
-        ''' Print validation error message and flag invalid. '''
-        nonlocal is_valid
+    def report(type, id, field, msg):
+        ''' Print validation message and flag invalid on error. '''
+        nonlocal is_valid, location
 
-        is_valid = False
-        warn(field, msg, type='error')
+        if type == 'error':
+            is_valid = False
 
-    def warn(field, msg, type='warn'):
-        ''' Print validation warning message. '''
-        nonlocal rownum, id
+        print(f'{type:5}: {location}, {id=}, {field=}, {msg}')
 
-        print(f'{type:5}: {rownum=}, {id=}, {field=}, {msg}')
+    def get_location(filenum, rownum):
+        ''' Location of a row, for validation messages. '''
+
+        if merge:
+            infile = args.infile[filenum].name
+            return f'{infile=}, {rownum=}'
+        else:
+            return f'{rownum=}'
+
+    # Several input files are merged by id, as is a single one to resolve
+    # duplicate ids; otherwise a single input file is read as is
+    merge = len(args.infile) > 1 or args.duplicates != 'error'
 
-    # Open CSV reader and writer
-    reader = csv.DictReader(TextIOFilter(args.infile), fieldnames=fieldnames)
+    # The row index is filled while the single input file is read, and
+    # records the state of the file before it is read
+    index = {} if args.index else None
+    if args.index:
+        stamp = get_stamp(args.infile[0].name)
+
+    if merge:
+        rows = resolve_duplicates(merge_inputs(args.infile, args.run_size,
+                                               index),
+                                  args.duplicates)
+    else:
+        rows = ((0, rownum, row, [])
+                for rownum, row in read_input(args.infile[0], index))
+
+    # Open CSV writer
     writer = csv.DictWriter(args.outfile, fieldnames=fieldnames+new_fieldnames)
     writer.writeheader()
 
     is_valid = True
     all_ids = set()
+    suggestions = Counter()
 
     # Iterate over the input rows
-    for rownum, row in enumerate(reader, start=1):
+    for filenum, rownum, row, dropped in rows:
 
-        # Skip the header
-        if 'Column1' in row['id']:
-            continue
+        for dropped_filenum, dropped_rownum in dropped:
+            location = get_location(dropped_filenum, dropped_rownum)
+            report('warn', normalize_id(row['id']), 'id',
+                   f'not unique, replaced by {get_location(filenum, rownum)}')
+
+        location = get_location(filenum, rownum)
+
+        # Merged rows come ordered by id, so only the current id needs to be
+        # kept for the uniqueness check
+        if merge and normalize_id(row['id']) not in all_ids:
+            all_ids.clear()
+
+        clean_row(row, all_ids, report)
+
+        if args.suggest:
+            suggestions.update(get_suggestions(row))
+
+        writer.writerow(row)
 
-        # Iterate over the fields in each row
-        for field in fieldnames:
+    # Write the autocomplete suggestion dictionary
+    if args.suggest:
+        write_suggestions(args.suggest, suggestions)
 
-            new_value = row[field]
+    # Write the sidecar row index for later targeted re-validation
+    if args.index:
+        write_index(args.index, index, stamp)
 
-            # Ensure we have the column
-            if new_value is None:
-                error(field, "field value is missing")
-                break
+    # Exit with error code if validation failed
+    if is_valid or not args.enforcing:
+        sys.exit(0)
+    else:
+        sys.exit(1)
 
-            if field == 'id':
-                id = row['id']
 
-                try:
-                    # strip out BOM
-                    id = id.replace('\ufeff', '')
+def normalize_id(value):
+    ''' Zero pad an input id to 8 digits, or None if it is not valid. '''
 
-                    id = int(id)
-                    if id < 1:
-                        raise ValueError(f'not a positive integer: {id}')
+    try:
+        id = int(value.replace('\ufeff', ''))
+    except ValueError:
+        return None
 
-                    # Zero pad id to 8 digits
-                    id = f"{int(id):08}"
+    if id < 1:
+        return None
 
-                    if id in all_ids:
-                        raise ValueError(f'not unique: {id}')
+    return f"{id:08}"
 
-                    all_ids.add(id)
-                    new_value = id
 
-                except ValueError as err:
-                    id = "?"
-                    error(f'id', str(err))
+def iter_records(f, start=0):
+    '''
+    Iterate over the CSV records of the binary file f, from byte offset start.
+    Yield (offset, values) for each record, with the byte offset where the
+    record starts. The lines are decoded and filtered as by TextIOFilter, so
+    the values are the same as those read by cleanup().
+    '''
 
-            else:
+    f.seek(start)
+    pos = start
 
-                # Replace Control character K (represents multiple values)
-                # with PIPE
-                new_value = new_value.replace('\v', '|')
+    def lines():
+        nonlocal pos
 
-                # Replace multiple PIPEs with single PIPE
-                # (To get rid of empty values in a multivalued field
-                new_value = p_multipipe.sub('|', new_value)
+        for line in f:
+            pos += len(line)
+            yield line.decode('UTF-8').replace('\r\n', '\n') \
+                                      .replace('\u0000', '')
 
-                # Trim extra spaces between values in a multivalued field
-                new_value = p_multispace.sub('|', new_value)
+    # csv.reader never reads past the end of the current record, so pos is
+    # the start of the next record when the current one is returned
+    offset = start
+    for values in csv.reader(lines()):
+        # Skip blank lines, like csv.DictReader
+        if values:
+            yield offset, values
+        offset = pos
 
-                # Trim extra space between fields
-                new_value = new_value.strip()
 
-                # Remove trailing PIPE in a field
-                new_value = p_trailingpipe.sub('', new_value)
+def read_indexed(path, index):
+    '''
+    Iterate over the rows of the input file at path as (rownum, row), like
+    csv.DictReader, and fill the row index as they are read: a dict of
+    id -> list of (offset, rownum), in input order. Rows with an invalid id
+    are not indexed.
+    '''
 
-            if field == 'title':
-                if new_value == "":
-                    new_value = "missing title"
-                    error('title', 'is empty')
+    with open(path, 'rb') as f:
+        for rownum, (offset, values) in enumerate(iter_records(f), start=1):
+            id = normalize_id(values[0])
+            if id is not None:
+                index.setdefault(id, []).append((offset, rownum))
 
-            if field == 'collection':
-                if new_value in collection_dict:
-                    csd = collection_dict[new_value]
-                    # cd = csd.split('::')[1]
-                    cd = csd
-                else:
-                    csd, cd = '', ''
-                    if new_value != "":
-                        error('collection', f'unknown value: {new_value}')
+            yield rownum, get_row(values)
 
-                # add new fields
-                row['collection_dictionary'] = cd
-                row['collection_sorted_dictionary'] = csd
 
-            if field == 'instrumentation':
+def build_index(f):
+    ''' Build the row index of the binary input file f; see read_indexed(). '''
 
-                if new_value != "":
+    index = {}
+
+    for rownum, (offset, values) in enumerate(iter_records(f), start=1):
+        id = normalize_id(values[0])
+        if id is not None:
+            index.setdefault(id, []).append((offset, rownum))
+
+    return index
 
-                    # Parse the instrument list, splitting on ',' and their
-                    # alternatives on '|'.
-                    inst_values = parse_inst_list(new_value)
 
-                    # Check for known values
-                    for alt in inst_values:
-                        for inst, _ in alt:
-                            if inst not in inst_dict:
-                                warn('instrumentation',
-                                     f'unknown value: {inst}')
+def get_stamp(path):
+    ''' Get the (size, mtime_ns) of the input file, to detect changes. '''
 
-                    field_id, field_idf, field_idfwa = \
-                        get_instrument_fields(inst_values)
+    stat = os.stat(path)
 
-                    row['instrumentation_dictionary'] = \
-                        ','.join(field_id)
+    return (stat.st_size, stat.st_mtime_ns)
 
-                    row['instrumentation_dictionary_full'] = \
-                        ','.join(field_idf)
 
-                    row['instrumentation_dictionary_full_with_alt'] = \
-                        ','.join(field_idfwa)
+def write_index(path, index, stamp):
+    '''
+    Write the row index as a sidecar file, one row per line, after a header
+    with the stamp of the indexed input file; see get_stamp().
+
+    The index is written to a temporary file replacing the target, so an
+    interrupted run never leaves a truncated index.
+    '''
+
+    entries = sorted((offset, rownum, id)
+                     for id, rows in index.items()
+                     for offset, rownum in rows)
+
+    # In the same directory, so os.replace() is atomic
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+
+    try:
+        with open(tmp_path, 'w', encoding='UTF-8') as f:
+            f.write(f'# input\t{stamp[0]}\t{stamp[1]}\n')
+            f.write('# id\toffset\trownum\n')
+            for offset, rownum, id in entries:
+                f.write(f'{id}\t{offset}\t{rownum}\n')
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_index(path, stamp):
+    '''
+    Read a sidecar row index. Return None if it does not exist, is malformed,
+    or was built for another state of the input file than stamp.
+    '''
+
+    index = {}
+    input_stamp = None
+
+    try:
+        with open(path, encoding='UTF-8') as f:
+            for line in f:
+                if line.startswith('# input\t'):
+                    _, size, mtime_ns = line.split('\t')
+                    input_stamp = (int(size), int(mtime_ns))
+                elif not line.startswith('#'):
+                    id, offset, rownum = line.split('\t')
+                    index.setdefault(id, []).append((int(offset),
+                                                     int(rownum)))
+    except (FileNotFoundError, ValueError):
+        # A malformed index, eg truncated, raises ValueError or its subclass
+        # UnicodeDecodeError
+        return None
+
+    if input_stamp != stamp:
+        return None
+
+    return index
+
+
+def get_row(values):
+    ''' Map the values of an input record to a dict, like csv.DictReader. '''
+
+    row = dict(zip(fieldnames, values))
+    if len(values) > len(fieldnames):
+        row[None] = values[len(fieldnames):]
+    for field in fieldnames[len(values):]:
+        row[field] = None
+
+    return row
+
+
+def read_row(f, offset):
+    '''
+    Read the input row starting at byte offset of the binary input file f,
+    as a dict like the ones from csv.DictReader.
+    '''
+
+    _, values = next(iter_records(f, offset))
+
+    return get_row(values)
+
+
+def lookup_rows(f, index, ids):
+    '''
+    Read the input rows for the ids using the row index, as a list of
+    (rownum, row) in input order. Ids missing from the index are skipped.
+
+    Return None if the index is stale, ie a row at an indexed offset no
+    longer has the indexed id.
+    '''
+
+    found = []
+
+    for id in ids:
+        for offset, rownum in index.get(id, []):
+            try:
+                row = read_row(f, offset)
+            except (StopIteration, csv.Error, UnicodeDecodeError):
+                return None
 
-            row[field] = new_value
+            if normalize_id(row['id']) != id:
+                return None
 
+            found.append((rownum, row))
+
+    return sorted(found, key=lambda x: x[0])
+
+
+def revalidate():
+    '''
+    Cleanup and validation of only the rows with the requested ids, read by
+    random access using the sidecar row index. The index is (re)built when
+    it is missing, malformed or stale, ie the input file has changed since
+    it was built; ids missing from a current index are reported without
+    reading the input file.
+    '''
+
+    def report(type, id, field, msg):
+        ''' Print validation message and flag invalid on error. '''
+        nonlocal is_valid, rownum
+
+        if type == 'error':
+            is_valid = False
+
+        print(f'{type:5}: {rownum=}, {id=}, {field=}, {msg}')
+
+    infile = args.infile[0].name
+    index_path = args.index or f'{infile}.idx'
+
+    is_valid = True
+    rownum = '?'
+
+    ids = []
+    for value in args.id:
+        id = normalize_id(value)
+        if id is None:
+            report('error', '?', 'id', f'not a positive integer: {value}')
+        elif id not in ids:
+            ids.append(id)
+
+    with open(infile, 'rb') as f:
+        stamp = get_stamp(infile)
+        index = read_index(index_path, stamp)
+        rows = None if index is None else lookup_rows(f, index, ids)
+
+        if rows is None:
+            index = build_index(f)
+            write_index(index_path, index, stamp)
+            rows = lookup_rows(f, index, ids)
+
+    for id in ids:
+        if id not in index:
+            report('error', id, 'id', f'not found: {infile}')
+
+    writer = csv.DictWriter(args.outfile, fieldnames=fieldnames+new_fieldnames)
+    writer.writeheader()
+
+    # Shared by the rows of a duplicated id, so they are reported as in a
+    # full run
+    all_ids = set()
+
+    for rownum, row in rows:
+        clean_row(row, all_ids, report)
         writer.writerow(row)
 
     # Exit with error code if validation failed
@@ -766,14 +1410,207 @@ class Test(TestCase):
 
         # self.assertEqual(idfwa, )
 
+    def test_get_composer_sort(self):
+        self.assertEqual(get_composer_sort('Absenger, Max'), 'absenger, max')
+        self.assertEqual(get_composer_sort('Dvořák ,  Antonín'),
+                         'dvorak, antonin')
+        self.assertEqual(get_composer_sort('Strauß, Johann|Lanner, Joseph'),
+                         'strauss, johann lanner, joseph')
+        self.assertEqual(get_composer_sort('Bart∏k, B∑la'), 'bartk, bla')
+        self.assertEqual(get_composer_sort('B∫ellmann, L∑on'),
+                         'bellmann, lon')
+        self.assertEqual(get_composer_sort(''), '')
+
+    def test_get_title_sort(self):
+        self.assertEqual(get_title_sort('The Alexander March Book'),
+                         'alexander march book')
+        self.assertEqual(get_title_sort('Le Tombeau de Couperin'),
+                         'tombeau de couperin')
+        self.assertEqual(get_title_sort("L'Histoire du Soldat"),
+                         'histoire du soldat')
+        self.assertEqual(get_title_sort('Die Zauberflöte'), 'zauberflote')
+        self.assertEqual(get_title_sort('"Adam lay y-bounden"'),
+                         'adam lay y-bounden"')
+        self.assertEqual(get_title_sort('Theme and Variations'),
+                         'theme and variations')
+        self.assertEqual(get_title_sort('Annie Laurie'), 'annie laurie')
+        self.assertEqual(get_title_sort('Vortragsstück|(Medley)'),
+                         'vortragsstuck (medley)')
+        self.assertEqual(get_title_sort('Die'), 'die')
+        self.assertEqual(get_title_sort('Etude in 3½ Minutes'),
+                         'etude in 3 1/2 minutes')
+        self.assertEqual(get_title_sort('¾ Time Waltz'), '3/4 time waltz')
+        self.assertEqual(get_title_sort('Solo voor ´n blaasinstrument'),
+                         "solo voor 'n blaasinstrument")
+        self.assertEqual(get_title_sort('Leidz∑n: Air'), 'leidzn: air')
+
+    def test_get_suggestions(self):
+        row = {'composer': 'Gould, Morton',
+               'title': 'Hymnal|(on "We Shall Overcome")',
+               'instrumentation_dictionary': 'clarinet,piano'}
+
+        self.assertEqual(list(get_suggestions(row)),
+                         [('Gould, Morton', 'composer'),
+                          ('Hymnal', 'title'),
+                          ('clarinet', 'instrumentation'),
+                          ('piano', 'instrumentation')])
+
+        row = {'composer': '', 'title': 'Swallows',
+               'instrumentation_dictionary': 'clarinet,2cl,band'}
+        self.assertEqual(list(get_suggestions(row)),
+                         [('Swallows', 'title'),
+                          ('clarinet', 'instrumentation')])
+
+        row = {'composer': 'Anonymous', 'title': missing_title}
+        self.assertEqual(list(get_suggestions(row)),
+                         [('Anonymous', 'composer')])
+
+    def test_get_suggestions_short_row(self):
+        row = {field: None for field in fieldnames}
+        row.update({'id': '1', 'composer': 'Bach, J.S.'})
+
+        messages = []
+        clean_row(row, set(), lambda *message: messages.append(message))
+
+        self.assertEqual(messages, [('error', '00000001', 'title',
+                                     'field value is missing')])
+        self.assertEqual(list(get_suggestions(row)),
+                         [('Bach, J.S.', 'composer')])
+
+    def test_write_suggestions(self):
+        suggestions = Counter({('Mozart', 'composer'): 3,
+                               ('Mozart', 'title'): 1,
+                               ('Fantasia', 'title'): 2,
+                               ('Fantasia', 'composer'): 2,
+                               ('clarinet', 'instrumentation'): 5,
+                               ('Multi\r\nline', 'composer'): 2,
+                               ('Multi\tline ', 'title'): 1,
+                               (' \n', 'composer'): 1})
+        f = StringIO()
+        write_suggestions(f, suggestions)
+
+        self.assertEqual(f.getvalue(),
+                         'clarinet\t5\tinstrumentation\n' +
+                         'Fantasia\t4\tcomposer\n' +
+                         'Mozart\t4\tcomposer\n' +
+                         'Multi line\t3\tcomposer\n')
+
+    def test_merge_inputs(self):
+        ica = StringIO('Column1,Column2\n3,c\n1,a\nbad,x\n')
+        aba = StringIO('2,b\n1,a2,,extra1,,,,,,,,,,,,,,extra2\n4\n')
+
+        merged = list(merge_inputs([ica, aba], run_size=2))
+
+        self.assertEqual([key for key, _ in merged],
+                         [(0, 1, 0, 3), (0, 1, 1, 2), (0, 2, 1, 1),
+                          (0, 3, 0, 2), (0, 4, 1, 3), (1, 0, 0, 4)])
+
+        # Missing and extra columns survive a spilled run
+        self.assertIsNone(merged[4][1]['composer'])
+        self.assertEqual(merged[1][1][None], ['extra2'])
+        self.assertEqual(merged[1][1]['composer'], 'a2')
+
+    def test_merge_inputs_fan_in(self):
+        global merge_fan_in
+
+        ids = [(i * 7919) % 50 + 1 for i in range(50)]
+        infiles = [StringIO(''.join(f'{id},c{id}\n' for id in ids[:30])),
+                   StringIO(''.join(f'{id},c{id}\n' for id in ids[30:]))]
+
+        # Spill every row and merge them two at a time, over several levels
+        saved, merge_fan_in = merge_fan_in, 2
+        try:
+            merged = list(merge_inputs(infiles, run_size=1))
+        finally:
+            merge_fan_in = saved
+
+        self.assertEqual([key[1] for key, _ in merged], sorted(ids))
+        self.assertEqual([row['composer'] for _, row in merged],
+                         [f'c{id}' for id in sorted(ids)])
+
+    def test_resolve_duplicates(self):
+        merged = [((0, 1, 0, 3), 'a'), ((0, 1, 1, 2), 'a2'),
+                  ((0, 1, 2, 9), 'a3'), ((0, 2, 1, 1), 'b'),
+                  ((1, 0, 0, 4), 'x'), ((1, 0, 1, 5), 'y')]
+
+        self.assertEqual(list(resolve_duplicates(merged, 'error')),
+                         [(0, 3, 'a', []), (1, 2, 'a2', []), (2, 9, 'a3', []),
+                          (1, 1, 'b', []), (0, 4, 'x', []), (1, 5, 'y', [])])
+
+        self.assertEqual(list(resolve_duplicates(merged, 'first')),
+                         [(0, 3, 'a', [(1, 2), (2, 9)]), (1, 1, 'b', []),
+                          (0, 4, 'x', []), (1, 5, 'y', [])])
+
+        self.assertEqual(list(resolve_duplicates(merged, 'last')),
+                         [(2, 9, 'a3', [(0, 3), (1, 2)]), (1, 1, 'b', []),
+                          (0, 4, 'x', []), (1, 5, 'y', [])])
+
+    def test_normalize_id(self):
+        self.assertEqual(normalize_id('12'), '00000012')
+        self.assertEqual(normalize_id('\ufeff1'), '00000001')
+        self.assertIsNone(normalize_id('0'))
+        self.assertIsNone(normalize_id('Column1'))
+
+    def test_build_index(self):
+        data = ('\ufeffColumn1,Column2\r\n' +
+                '1,"Abbate, Luigi"\r\n' +
+                '\r\n' +
+                '2,"Multi\r\nline"\r\n' +
+                'bad,Ä\r\n' +
+                '2,Dup\r\n').encode('UTF-8')
+        f = BytesIO(data)
+
+        index = build_index(f)
+        self.assertEqual(index, {'00000001': [(20, 2)],
+                                 '00000002': [(41, 3), (66, 5)]})
+
+        row = read_row(f, 41)
+        self.assertEqual(row['id'], '2')
+        self.assertEqual(row['composer'], 'Multi\nline')
+        self.assertIsNone(row['title'])
+
+        self.assertEqual(lookup_rows(f, index, ['00000002', '00000009']),
+                         [(3, read_row(f, 41)), (5, read_row(f, 66))])
+
+        # Stale index
+        self.assertIsNone(lookup_rows(f, {'00000001': [(41, 2)]},
+                                      ['00000001']))
+
+    def test_read_index(self):
+        index = {'00000001': [(20, 2)], '00000002': [(41, 3), (66, 5)]}
+
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'data.csv.idx')
+
+            self.assertIsNone(read_index(path, (100, 1)))
+
+            write_index(path, index, (100, 1))
+            self.assertEqual(os.listdir(tmp), ['data.csv.idx'])
+            self.assertEqual(read_index(path, (100, 1)), index)
+
+            # Input file changed since the index was built
+            self.assertIsNone(read_index(path, (100, 2)))
+            self.assertIsNone(read_index(path, (101, 1)))
+
+            # Corrupt or truncated index
+            for data in [b'garbage\n', b'# input\t100\n',
+                         b'# input\t100\t1\n00000001\t2',
+                         b'# input\t100\t1\n00000001\tx\t2\n',
+                         b'\xff\xfe\n']:
+                with open(path, 'wb') as f:
+                    f.write(data)
+                self.assertIsNone(read_index(path, (100, 1)), data)
+
 
 if __name__ == '__main__':
     # Setup command line arguments
     parser = ArgumentParser()
 
-    parser.add_argument("-i", "--infile", required=True,
+    parser.add_argument("-i", "--infile", required=True, nargs="+",
                         type=FileType('r', encoding='UTF-8'),
-                        help="CSV input file")
+                        help="CSV input file; several files (eg one export " +
+                             "per collection) are merged in one pass, " +
+                             "ordered by id")
 
     parser.add_argument("-o", "--outfile", required=True,
                         type=FileType('w', encoding='UTF-8'),
@@ -783,8 +1620,62 @@ if __name__ == '__main__':
                         help='enforce failed validation or unit tests by ' +
                              'exiting with a status code of 1')
 
+    parser.add_argument("-d", "--duplicates",
+                        choices=["error", "first", "last"],
+                        help='policy for duplicate ids: report them as ' +
+                             'errors, or keep the row from the first or ' +
+                             'last input file, merging the input by id ' +
+                             'even for a single file (default: error)')
+
+    parser.add_argument("--run-size", type=int,
+                        help='number of rows sorted in memory when merging ' +
+                             'several input files, or one with ' +
+                             '--duplicates=first or last, before spilling ' +
+                             'to a temporary file ' +
+                             f'(default: {default_run_size})')
+
+    parser.add_argument("-s", "--suggest",
+                        type=FileType('w', encoding='UTF-8'),
+                        help='autocomplete suggestion dictionary output ' +
+                             'file, with the composer, title and ' +
+                             'instrument labels weighted by popularity')
+
+    parser.add_argument("-x", "--index",
+                        help='sidecar row index file, mapping each id to ' +
+                             'its byte offset and row number; written by a ' +
+                             'full run, and used by --id (default with ' +
+                             '--id: INFILE.idx)')
+
+    parser.add_argument("--id", action="append",
+                        help='only cleanup and validate the row with this ' +
+                             'id, using the row index (may be repeated)')
+
     # Process command line arguments
     args = parser.parse_args()
 
+    if (args.index or args.id) and (len(args.infile) > 1 or
+                                    args.infile[0] is sys.stdin):
+        parser.error('--index and --id need a single named input file')
+
+    if args.id and (args.suggest or args.duplicates or args.run_size):
+        parser.error('--suggest, --duplicates and --run-size do not apply ' +
+                     'to --id')
+
+    if args.duplicates is None:
+        args.duplicates = 'error'
+
+    if args.run_size is not None and len(args.infile) == 1 and \
+            args.duplicates == 'error':
+        parser.error('--run-size only applies when merging several input ' +
+                     'files, or one with --duplicates=first or last')
+
+    if args.run_size is None:
+        args.run_size = default_run_size
+    elif args.run_size < 1:
+        parser.error('--run-size must be at least 1')
+
     # Run the CSV validation and cleanup
-    cleanup()
+    if args.id:
+        revalidate()
+    else:
+        cleanup()
@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+
+import csv
+import sys
+import json
+import time
+import hashlib
+import platform
+import resource
+import subprocess
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from argparse import ArgumentParser
+
+# Golden-output regression harness for cleanup.py:
+#
+# - run the cleaner on the full catalog (data.csv)
+# - compare the output against a stored golden digest, per row and per
+#   column, and report the first row that differs
+# - record throughput and peak memory and compare them against a stored
+#   baseline, within a tolerance
+#
+# The golden digest only depends on the data and the cleaner, so it belongs
+# in version control. The performance baseline depends on the machine: it
+# records the hostname and CPU, is measured locally with --update-baseline,
+# and is not committed. A missing baseline, or one measured on another
+# machine, fails the check unless --skip-perf is given.
+
+scripts_dir = Path(__file__).resolve().parent
+
+default_cleaner = scripts_dir / 'cleanup.py'
+default_infile = scripts_dir.parent / 'data.csv'
+default_golden = scripts_dir / 'golden.json'
+default_baseline = scripts_dir / 'baseline.json'
+
+# Size of the per-row digests, in bytes. The overall sha256 digest decides
+# whether the output matches; row digests only need to be long enough to
+# locate the first difference, and short enough to keep golden.json small.
+row_digest_size = 4
+
+# Number of row digests per line of golden.json, so an update to a few rows
+# only changes a few lines
+rows_per_line = 32
+
+# Columns whose comma separated values have no defined order, and are sorted
+# before hashing. get_instrument_fields() collects the counts of each
+# instrument in a set, and a set mixing int and str counts ('optional',
+# 'ensemble') iterates in an order that depends on str hash randomization.
+unordered_columns = ['instrumentation_dictionary_full']
+
+
+def run_cleaner(cleaner, infile, outfile, logfile):
+    '''
+    Run the cleaner as a separate process, exactly as the Dockerfile does.
+
+    Return a dict with the exit status, the wall time in seconds and the peak
+    resident memory of the cleaner process in KiB.
+    '''
+
+    with open(logfile, 'w', encoding='UTF-8') as log:
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, str(cleaner),
+                               f'--infile={infile}', f'--outfile={outfile}'],
+                              stdout=log, stderr=subprocess.PIPE, text=True)
+        elapsed = time.perf_counter() - start
+
+    if proc.returncode != 0:
+        raise RuntimeError(f'cleaner failed ({proc.returncode}): ' +
+                           proc.stderr.strip())
+
+    # ru_maxrss is the high water mark over all waited-for children, so this
+    # is only accurate for the first run in a process; see measure().
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return {'status': proc.returncode,
+            'seconds': elapsed,
+            'peak_kib': usage.ru_maxrss}
+
+
+def digest_output(outfile, logfile):
+    ''' Compute the golden digest of a cleaner output and log file. '''
+
+    overall = hashlib.sha256()
+    log = hashlib.sha256()
+    columns = {}
+    rows, ids = [], []
+
+    with open(outfile, encoding='UTF-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        column_hashes = [hashlib.sha256() for _ in header]
+        unordered = [i for i, name in enumerate(header)
+                     if name in unordered_columns]
+
+        for values in reader:
+            for i in unordered:
+                if i < len(values):
+                    values[i] = ','.join(sorted(values[i].split(',')))
+
+            record = '\x1f'.join(values).encode('UTF-8') + b'\x1e'
+            overall.update(record)
+            rows.append(hashlib.blake2b(
+                record, digest_size=row_digest_size).hexdigest())
+            ids.append(values[0] if values else '')
+
+            for h, value in zip(column_hashes, values):
+                h.update(value.encode('UTF-8') + b'\x1e')
+
+    for name, h in zip(header, column_hashes):
+        columns[name] = h.hexdigest()
+
+    with open(logfile, 'rb') as f:
+        for line in f:
+            log.update(line)
+
+    return {'header': header,
+            'digest': overall.hexdigest(),
+            'log': log.hexdigest(),
+            'columns': columns,
+            'ids': ids,
+            'rows': rows}
+
+
+def compare_digest(golden, current):
+    '''
+    Compare a current digest against the golden one.
+
+    Return a list of human readable differences; an empty list means the
+    output matches.
+    '''
+
+    diffs = []
+
+    if golden['header'] != current['header']:
+        diffs.append(f"header differs: {golden['header']} != " +
+                     f"{current['header']}")
+
+    for name in golden['header']:
+        if name not in current['columns']:
+            diffs.append(f'column missing: {name}')
+        elif golden['columns'][name] != current['columns'][name]:
+            diffs.append(f'column differs: {name}')
+
+    for name in current['header']:
+        if name not in golden['columns']:
+            diffs.append(f'column added: {name}')
+
+    if len(golden['rows']) != len(current['rows']):
+        diffs.append(f"row count differs: {len(golden['rows'])} != " +
+                     f"{len(current['rows'])}")
+
+    for rownum, (old, new) in enumerate(zip(golden['rows'], current['rows']),
+                                        start=1):
+        if old != new:
+            id = current['ids'][rownum - 1]
+            diffs.append(f'first row that differs: {rownum=}, {id=}')
+            break
+    else:
+        if golden['digest'] != current['digest'] and \
+                len(golden['rows']) == len(current['rows']):
+            diffs.append('output differs (row digest collision)')
+
+    if golden['log'] != current['log']:
+        diffs.append('validation messages differ')
+
+    return diffs
+
+
+def compare_perf(baseline, current, tolerance):
+    '''
+    Compare throughput and peak memory against the baseline.
+
+    Only regressions beyond the tolerance (a fraction, eg 0.2 for 20%) are
+    reported; improvements are left to --update-baseline.
+    '''
+
+    diffs = []
+
+    min_rate = baseline['rows_per_second'] * (1 - tolerance)
+    if current['rows_per_second'] < min_rate:
+        diffs.append(f"throughput regressed: {current['rows_per_second']:.0f}"
+                     f" < {baseline['rows_per_second']:.0f} rows/s " +
+                     f'(tolerance {tolerance:.0%})')
+
+    max_peak = baseline['peak_kib'] * (1 + tolerance)
+    if current['peak_kib'] > max_peak:
+        diffs.append(f"peak memory regressed: {current['peak_kib']} > " +
+                     f"{baseline['peak_kib']} KiB (tolerance {tolerance:.0%})")
+
+    return diffs
+
+
+def measure(cleaner, infile, repeat):
+    '''
+    Run the cleaner on infile and return (digest, perf).
+
+    The first run gives the digest and the peak memory; throughput is taken
+    from the fastest of the repeated runs to reduce noise.
+    '''
+
+    with TemporaryDirectory() as tmp:
+        outfile = Path(tmp) / 'clean.csv'
+        logfile = Path(tmp) / 'clean.log'
+
+        runs = [run_cleaner(cleaner, infile, outfile, logfile)]
+        digest = digest_output(outfile, logfile)
+
+        for _ in range(repeat - 1):
+            runs.append(run_cleaner(cleaner, infile, outfile, logfile))
+
+    seconds = min(run['seconds'] for run in runs)
+
+    perf = {'rows': len(digest['rows']),
+            'seconds': round(seconds, 4),
+            'rows_per_second': round(len(digest['rows']) / seconds, 1),
+            'peak_kib': runs[0]['peak_kib']}
+
+    return digest, perf
+
+
+def get_machine():
+    ''' Identify the machine a performance baseline was measured on. '''
+
+    cpu = platform.processor() or platform.machine()
+
+    try:
+        with open('/proc/cpuinfo', encoding='UTF-8') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    cpu = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+
+    return {'hostname': platform.node(), 'cpu': cpu}
+
+
+def load_json(path):
+    ''' Load a stored digest or baseline, or None if it does not exist. '''
+
+    try:
+        with open(path, encoding='UTF-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def pack_rows(rows):
+    ''' Concatenate the row digests, rows_per_line per string. '''
+
+    return [''.join(rows[i:i + rows_per_line])
+            for i in range(0, len(rows), rows_per_line)]
+
+
+def unpack_rows(lines):
+    ''' Split the row digests packed by pack_rows(). '''
+
+    packed = ''.join(lines)
+    size = row_digest_size * 2
+
+    return [packed[i:i + size] for i in range(0, len(packed), size)]
+
+
+def save_json(path, obj):
+    ''' Store a digest or baseline. '''
+
+    with open(path, 'w', encoding='UTF-8') as f:
+        json.dump(obj, f, indent=1)
+        f.write('\n')
+
+
+def main():
+    ''' Check or update the golden digest and the performance baseline. '''
+
+    digest, perf = measure(args.cleaner, args.infile, args.repeat)
+
+    print(f"rows: {perf['rows']}, seconds: {perf['seconds']}, " +
+          f"rows/s: {perf['rows_per_second']}, " +
+          f"peak memory: {perf['peak_kib']} KiB")
+
+    if args.update_golden:
+        # The ids are only needed to report the current output
+        golden = {k: v for k, v in digest.items() if k != 'ids'}
+        golden['rows'] = pack_rows(digest['rows'])
+        save_json(args.golden, golden)
+        print(f'updated golden digest: {args.golden}')
+
+    if args.update_baseline:
+        save_json(args.baseline, dict(perf, machine=get_machine()))
+        print(f'updated performance baseline: {args.baseline}')
+
+    diffs = []
+
+    golden = load_json(args.golden)
+    if golden is None:
+        diffs.append(f'golden digest not found: {args.golden}')
+    else:
+        golden['rows'] = unpack_rows(golden['rows'])
+        diffs.extend(compare_digest(golden, digest))
+
+    if not args.skip_perf:
+        baseline = load_json(args.baseline)
+        if baseline is None:
+            diffs.append(f'performance baseline not found: {args.baseline}' +
+                         '; measure one with --update-baseline, or use ' +
+                         '--skip-perf')
+        elif baseline.get('machine') != get_machine():
+            diffs.append('performance baseline was measured on another ' +
+                         f"machine ({baseline.get('machine')}); measure " +
+                         'one here with --update-baseline, or use ' +
+                         '--skip-perf')
+        else:
+            diffs.extend(compare_perf(baseline, perf, args.tolerance))
+
+    for diff in diffs:
+        print(f'error: {diff}')
+
+    if diffs:
+        sys.exit(1)
+    else:
+        print('ok')
+        sys.exit(0)
+
+
+class Test(TestCase):
+
+    def setUp(self):
+        self.golden = {
+            'header': ['id', 'title'],
+            'digest': 'x',
+            'log': 'l',
+            'columns': {'id': 'a', 'title': 'b'},
+            'ids': ['00000001', '00000002', '00000003'],
+            'rows': ['r1', 'r2', 'r3'],
+        }
+
+    def current(self, **changes):
+        current = json.loads(json.dumps(self.golden))
+        current.update(changes)
+        return current
+
+    def test_digest_output(self):
+        with TemporaryDirectory() as tmp:
+            outfile = Path(tmp) / 'clean.csv'
+            logfile = Path(tmp) / 'clean.log'
+
+            outfile.write_text('id,title\n00000001,"a, b"\n00000002,c\n',
+                               encoding='UTF-8')
+            logfile.write_text('', encoding='UTF-8')
+            first = digest_output(outfile, logfile)
+
+            outfile.write_text('id,title\n00000001,"a, b"\n00000002,d\n',
+                               encoding='UTF-8')
+            second = digest_output(outfile, logfile)
+
+            outfile.write_text('id,instrumentation_dictionary_full\n' +
+                               '00000001,"oboe001::1 oboe,oboe002::2 oboe"\n',
+                               encoding='UTF-8')
+            ordered = digest_output(outfile, logfile)
+
+            outfile.write_text('id,instrumentation_dictionary_full\n' +
+                               '00000001,"oboe002::2 oboe,oboe001::1 oboe"\n',
+                               encoding='UTF-8')
+            unordered = digest_output(outfile, logfile)
+
+        self.assertEqual(first['ids'], ['00000001', '00000002'])
+        self.assertEqual(first['rows'][0], second['rows'][0])
+        self.assertNotEqual(first['rows'][1], second['rows'][1])
+        self.assertEqual(first['columns']['id'], second['columns']['id'])
+        self.assertNotEqual(first['columns']['title'],
+                            second['columns']['title'])
+        self.assertNotEqual(first['digest'], second['digest'])
+
+        self.assertEqual(ordered['digest'], unordered['digest'])
+        self.assertEqual(ordered['rows'], unordered['rows'])
+
+    def test_compare_digest(self):
+        self.assertEqual(compare_digest(self.golden, self.current()), [])
+
+        current = self.current(digest='y', rows=['r1', 'x2', 'x3'],
+                               columns={'id': 'a', 'title': 'c'})
+        self.assertEqual(compare_digest(self.golden, current),
+                         ['column differs: title',
+                          "first row that differs: rownum=2, " +
+                          "id='00000002'"])
+
+        current = self.current(digest='y', rows=['r1', 'r2'],
+                               ids=['00000001', '00000002'], log='m')
+        self.assertEqual(compare_digest(self.golden, current),
+                         ['row count differs: 3 != 2',
+                          'validation messages differ'])
+
+    def test_pack_rows(self):
+        rows = [f'{i:08x}' for i in range(rows_per_line * 2 + 1)]
+        packed = pack_rows(rows)
+
+        self.assertEqual(len(packed), 3)
+        self.assertEqual(packed[2], rows[-1])
+        self.assertEqual(unpack_rows(packed), rows)
+        self.assertEqual(unpack_rows(pack_rows([])), [])
+
+    def test_compare_perf(self):
+        baseline = {'rows_per_second': 1000, 'peak_kib': 1000}
+
+        self.assertEqual(compare_perf(baseline, {'rows_per_second': 850,
+                                                 'peak_kib': 1150}, 0.2), [])
+        self.assertEqual(compare_perf(baseline, {'rows_per_second': 5000,
+                                                 'peak_kib': 10}, 0.2), [])
+
+        diffs = compare_perf(baseline, {'rows_per_second': 700,
+                                        'peak_kib': 1300}, 0.2)
+        self.assertEqual(len(diffs), 2)
+        self.assertTrue(diffs[0].startswith('throughput regressed'))
+        self.assertTrue(diffs[1].startswith('peak memory regressed'))
+
+
+if __name__ == '__main__':
+    # Setup command line arguments
+    parser = ArgumentParser()
+
+    parser.add_argument("-i", "--infile", default=default_infile,
+                        help=f"CSV input file (default: {default_infile})")
+
+    parser.add_argument("-c", "--cleaner", default=default_cleaner,
+                        help=f"cleanup script (default: {default_cleaner})")
+
+    parser.add_argument("-g", "--golden", default=default_golden,
+                        help=f"golden digest (default: {default_golden})")
+
+    parser.add_argument("-b", "--baseline", default=default_baseline,
+                        help="performance baseline " +
+                             f"(default: {default_baseline})")
+
+    parser.add_argument("-t", "--tolerance", type=float, default=0.25,
+                        help="allowed throughput and peak memory " +
+                             "regression, as a fraction (default: 0.25)")
+
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="number of timed runs; the fastest is used " +
+                             "(default: 3)")
+
+    parser.add_argument("--skip-perf", action="store_true",
+                        help="only check the golden digest")
+
+    parser.add_argument("--update-golden", action="store_true",
+                        help="store the current output as the golden digest")
+
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store the current throughput and peak memory " +
+                             "as the performance baseline")
+
+    # Process command line arguments
+    args = parser.parse_args()
+
+    # Run the regression check
+    main()
@@ -0,0 +1,629 @@
+#!/usr/bin/env python3
+
+import re
+import csv
+import sys
+import json
+import time
+import random
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError, URLError
+from urllib.parse import parse_qsl, urlencode, urlsplit, unquote
+from urllib.request import urlopen
+from unittest import TestCase
+from argparse import ArgumentParser, FileType
+
+# Load test the scpa-scores core:
+#
+# - replay captured /select queries from a Solr request log, or build
+#   synthetic queries from the real facet values of a cleaned catalog
+# - send them at a set concurrency and rate
+# - report latency percentiles, throughput and error rate
+# - report the filterCache, queryResultCache and documentCache hit ratios
+#   over the run, from the admin MBeans endpoint
+#
+# Use --stub to run against a bundled local stub server instead of Solr.
+
+default_url = 'http://localhost:8983/solr/scpa-scores'
+
+# Caches reported from the admin MBeans endpoint
+cache_names = ['filterCache', 'queryResultCache', 'documentCache']
+
+# Facet fields used by the search interface, and the cleaned catalog columns
+# holding their values (multiple values are separated by ',' or '|')
+facet_fields = {
+    'collection_sorted_dictionary': ('collection_sorted_dictionary', None),
+    'instrumentation_dictionary': ('instrumentation_dictionary', ','),
+    'ensemble_size': ('ensemble_size', '|'),
+    'special': ('special', '|'),
+}
+
+# Free text fields used for synthetic q parameters
+text_fields = ['composer', 'title']
+
+percentiles = [50, 90, 95, 99]
+
+# Solr request log: "... path=/select params={q=...&fq=...} hits=1 ..."
+p_log_params = re.compile(r'path=/select params=\{(.*?)\}' +
+                          r'(?: hits=| status=|$)')
+p_word = re.compile(r'\w{3,}')
+
+
+def parse_query_log(lines):
+    '''
+    Parse the /select queries out of a query log. Each line may be:
+      a Solr request log line containing "path=/select params={...}"
+      a URL or path with "/select?..."
+      a bare query string "q=...&fq=..."
+
+    Return a list of query parameter lists, as (name, value) tuples.
+    '''
+
+    queries = []
+
+    for line in lines:
+        line = line.strip()
+        if line == '' or line.startswith('#'):
+            continue
+
+        match = p_log_params.search(line)
+        if match:
+            query = match.group(1)
+        elif '/select?' in line:
+            query = line.split('/select?', 1)[1]
+        elif 'path=' in line:
+            # Another request handler
+            continue
+        else:
+            query = line
+
+        params = parse_qsl(query, keep_blank_values=True)
+        if params:
+            queries.append(params)
+
+    return queries
+
+
+def split_values(value, separator):
+    ''' Split a cleaned catalog value into its multiple values. '''
+
+    if value == '':
+        return []
+    elif separator is None:
+        return [value]
+    else:
+        return [v for v in value.split(separator) if v != '']
+
+
+def synthetic_queries(catalog, count, seed=0):
+    '''
+    Build synthetic /select queries from the cleaned catalog (the output of
+    cleanup.py). Facet values and words are drawn with their real frequency
+    in the catalog, so popular values repeat as they do in real traffic.
+    '''
+
+    values = {field: Counter() for field in facet_fields}
+    words = Counter()
+
+    for row in csv.DictReader(catalog):
+        for field, (column, separator) in facet_fields.items():
+            values[field].update(split_values(row.get(column) or '',
+                                              separator))
+        for column in text_fields:
+            words.update(w.lower() for w in p_word.findall(row.get(column)
+                                                           or ''))
+
+    rnd = random.Random(seed)
+
+    def choose(counter):
+        population = list(counter)
+        return rnd.choices(population, weights=counter.values())[0]
+
+    fields = [field for field in facet_fields if values[field]]
+    queries = []
+
+    for _ in range(count):
+        params = [('q', choose(words) if words and rnd.random() < 0.5
+                   else '*:*')]
+
+        # Zero to two facet filters, as a user drilling down would apply
+        for field in rnd.sample(fields, min(len(fields), rnd.randint(0, 2))):
+            value = choose(values[field]).replace('"', '\\"')
+            params.append(('fq', f'{field}:"{value}"'))
+
+        params.append(('facet', 'true'))
+        params.extend(('facet.field', field) for field in facet_fields)
+        params.append(('rows', '10'))
+        queries.append(params)
+
+    return queries
+
+
+def get_json(url, timeout):
+    ''' GET a Solr URL and return the decoded JSON response. '''
+
+    with urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+
+def select_url(base_url, params):
+    ''' Build the /select URL for the query params, with a JSON response. '''
+
+    params = [(k, v) for k, v in params if k != 'wt'] + [('wt', 'json')]
+    return f'{base_url}/select?{urlencode(params)}'
+
+
+def get_cache_stats(base_url, timeout=10):
+    '''
+    Get the lookups and hits of each cache from the admin MBeans endpoint.
+
+    Return a dict of cache name -> (lookups, hits).
+    '''
+
+    url = f'{base_url}/admin/mbeans?cat=CACHE&stats=true&wt=json'
+    mbeans = get_json(url, timeout)['solr-mbeans']
+
+    # The response is a flat list of alternating category names and beans
+    beans = {}
+    for category, entries in zip(mbeans[::2], mbeans[1::2]):
+        if category == 'CACHE':
+            beans.update(entries)
+
+    stats = {}
+    for name in cache_names:
+        if name not in beans:
+            continue
+
+        lookups, hits = 0, 0
+        for key, value in beans[name].get('stats', {}).items():
+            # Solr 8 uses eg "CACHE.searcher.filterCache.lookups", older
+            # versions only "lookups"
+            if key.split('.')[-1] == 'lookups':
+                lookups = int(value)
+            elif key.split('.')[-1] == 'hits':
+                hits = int(value)
+
+        stats[name] = (lookups, hits)
+
+    return stats
+
+
+def cache_hit_ratios(before, after):
+    ''' Hit ratio of each cache over the run, or None without lookups. '''
+
+    ratios = {}
+
+    for name, (lookups, hits) in after.items():
+        old_lookups, old_hits = before.get(name, (0, 0))
+
+        # The counters reset when a new searcher is opened
+        if lookups < old_lookups:
+            old_lookups, old_hits = 0, 0
+
+        lookups, hits = lookups - old_lookups, hits - old_hits
+        ratios[name] = {'lookups': lookups,
+                        'hits': hits,
+                        'hit_ratio': hits / lookups if lookups else None}
+
+    return ratios
+
+
+def percentile(sorted_values, pct):
+    ''' Nearest-rank percentile of an already sorted list. '''
+
+    if not sorted_values:
+        return None
+
+    rank = max(1, -(-pct * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def run_load(base_url, queries, requests, concurrency, rate, timeout=30):
+    '''
+    Send requests /select queries (cycling through queries) using
+    concurrency threads. With a rate (requests per second), the requests are
+    sent on a fixed schedule and latency is measured from the scheduled time,
+    so a slow server is not hidden by the load tester backing off.
+
+    Return a dict with the latency percentiles, throughput and error rate.
+    '''
+
+    latencies = []
+    errors = Counter()
+    lock = threading.Lock()
+
+    def send(i):
+        params = queries[i % len(queries)]
+
+        if rate:
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            scheduled = time.perf_counter()
+
+        try:
+            response = get_json(select_url(base_url, params), timeout)
+            status = response.get('responseHeader', {}).get('status', 0)
+            error = f'status {status}' if status != 0 else None
+        except HTTPError as err:
+            error = f'HTTP {err.code}'
+        except (URLError, OSError, ValueError) as err:
+            error = type(err).__name__
+
+        latency = time.perf_counter() - scheduled
+
+        with lock:
+            if error is None:
+                latencies.append(latency)
+            else:
+                errors[error] += 1
+
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(send, i) for i in range(requests)]:
+            future.result()
+
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'rate': rate,
+        'seconds': elapsed,
+        'throughput': requests / elapsed if elapsed else None,
+        'errors': dict(errors),
+        'error_rate': sum(errors.values()) / requests if requests else 0,
+        'latency_ms': dict(
+            [(f'p{pct}', percentile(latencies, pct) * 1000
+              if latencies else None) for pct in percentiles] +
+            [('max', latencies[-1] * 1000 if latencies else None)]),
+    }
+
+
+def print_report(results, file=sys.stdout):
+    ''' Print the load test results. '''
+
+    def ms(value):
+        return '-' if value is None else f'{value:.1f}ms'
+
+    print(f"requests: {results['requests']}, " +
+          f"concurrency: {results['concurrency']}, " +
+          f"rate: {results['rate'] or 'unlimited'}", file=file)
+    print(f"throughput: {results['throughput']:.1f} req/s " +
+          f"in {results['seconds']:.2f}s", file=file)
+    print('latency: ' + ', '.join(f'{k}={ms(v)}'
+                                  for k, v in results['latency_ms'].items()),
+          file=file)
+    print(f"errors: {results['error_rate']:.2%} {results['errors']}",
+          file=file)
+
+    for name, cache in results.get('caches', {}).items():
+        ratio = cache['hit_ratio']
+        ratio = '-' if ratio is None else f'{ratio:.2%}'
+        print(f"{name}: hit ratio {ratio} ({cache['hits']}/" +
+              f"{cache['lookups']})", file=file)
+
+
+class LRUCounter:
+    ''' An LRU cache that only counts lookups and hits, for the stub. '''
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+
+    def lookup(self, key):
+        self.lookups += 1
+
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        else:
+            self.entries[key] = True
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+class StubSolr(ThreadingHTTPServer):
+    '''
+    A local stub of the scpa-scores core, serving /select and the CACHE
+    admin MBeans. It simulates LRU filter, query result and document caches
+    so the load tester reports plausible hit ratios, and answers with a fixed
+    latency. Queries with q=error return a 500 response.
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), core='scpa-scores',
+                 cache_size=512, latency=0.0):
+        super().__init__(address, StubSolrHandler)
+        self.core = core
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.caches = {name: LRUCounter(cache_size) for name in cache_names}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/solr/{self.core}'
+
+    def select(self, params):
+        ''' Update the simulated caches for a query and build the response. '''
+
+        q = params.get('q', ['*:*'])[0]
+        fqs = params.get('fq', [])
+        start = int(params.get('start', ['0'])[0])
+        rows = int(params.get('rows', ['10'])[0])
+
+        with self.lock:
+            for fq in fqs:
+                self.caches['filterCache'].lookup(fq)
+            self.caches['queryResultCache'].lookup(
+                (q, tuple(sorted(fqs)), params.get('sort', [''])[0]))
+
+            # Pretend the query matches documents derived from its text
+            numfound = hash((q, tuple(sorted(fqs)))) % 1000
+            docs = [f'{(hash(q) + i) % 30000:08}'
+                    for i in range(start, min(start + rows, numfound))]
+            for doc in docs:
+                self.caches['documentCache'].lookup(doc)
+
+        return {'responseHeader': {'status': 0, 'QTime': 0},
+                'response': {'numFound': numfound, 'start': start,
+                             'docs': [{'id': doc} for doc in docs]}}
+
+    def mbeans(self):
+        ''' Build the CACHE admin MBeans response, in the Solr 8 format. '''
+
+        with self.lock:
+            beans = {name: {'class': 'org.apache.solr.search.LRUCache',
+                            'stats': {
+                                f'CACHE.searcher.{name}.lookups': c.lookups,
+                                f'CACHE.searcher.{name}.hits': c.hits,
+                            }}
+                     for name, c in self.caches.items()}
+
+        return {'responseHeader': {'status': 0, 'QTime': 0},
+                'solr-mbeans': ['CACHE', beans]}
+
+
+class StubSolrHandler(BaseHTTPRequestHandler):
+    ''' Request handler for StubSolr. '''
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {}
+        for name, value in parse_qsl(url.query, keep_blank_values=True):
+            params.setdefault(name, []).append(value)
+
+        prefix = f'/solr/{self.server.core}'
+        path = unquote(url.path)
+
+        if path == f'{prefix}/select':
+            if params.get('q') == ['error']:
+                self.send_json(500, {'responseHeader': {'status': 500},
+                                     'error': {'msg': 'stub error'}})
+                return
+            time.sleep(self.server.latency)
+            self.send_json(200, self.server.select(params))
+        elif path == f'{prefix}/admin/mbeans':
+            self.send_json(200, self.server.mbeans())
+        else:
+            self.send_json(404, {'error': {'msg': f'not found: {path}'}})
+
+    def send_json(self, code, obj):
+        body = json.dumps(obj).encode('UTF-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(**kwargs):
+    ''' Start a StubSolr in a background thread and return it. '''
+
+    stub = StubSolr(**kwargs)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    return stub
+
+
+def loadtest(base_url, queries, requests, concurrency, rate):
+    ''' Run the load test, adding the cache hit ratios to the results. '''
+
+    before = get_cache_stats(base_url)
+    results = run_load(base_url, queries, requests, concurrency, rate)
+    after = get_cache_stats(base_url)
+
+    results['caches'] = cache_hit_ratios(before, after)
+
+    return results
+
+
+def main():
+    ''' Load the queries and run the load test. '''
+
+    if args.log:
+        queries = parse_query_log(args.log)
+    else:
+        queries = synthetic_queries(args.catalog, args.requests, args.seed)
+
+    if not queries:
+        print('error: no queries to send', file=sys.stderr)
+        sys.exit(1)
+
+    url = args.url.rstrip('/')
+    stub = None
+    if args.stub:
+        stub = start_stub(latency=args.stub_latency / 1000)
+        url = stub.url
+
+    try:
+        results = loadtest(url, queries, args.requests, args.concurrency,
+                           args.rate)
+    finally:
+        if stub is not None:
+            stub.shutdown()
+            stub.server_close()
+
+    print_report(results)
+
+    if args.json:
+        json.dump(results, args.json, indent=1)
+        args.json.write('\n')
+
+    # Exit with error code if too many requests failed
+    if results['error_rate'] > args.max_error_rate:
+        sys.exit(1)
+    else:
+        sys.exit(0)
+
+
+class Test(TestCase):
+
+    def test_parse_query_log(self):
+        lines = [
+            '2021-11-10 12:00:00.000 INFO  (qtp-1) [   x:scpa-scores] ' +
+            'o.a.s.c.S.Request [scpa-scores]  webapp=/solr path=/select ' +
+            'params={q=clarinet&fq=special:"Solos"&wt=json} hits=3 ' +
+            'status=0 QTime=1',
+            '... webapp=/solr path=/update params={} status=0 QTime=5',
+            'http://localhost:8983/solr/scpa-scores/select?q=oboe&rows=5',
+            '# comment',
+            'q=*:*&fq=ensemble_size:Trio',
+        ]
+
+        self.assertEqual(parse_query_log(lines),
+                         [[('q', 'clarinet'), ('fq', 'special:"Solos"'),
+                           ('wt', 'json')],
+                          [('q', 'oboe'), ('rows', '5')],
+                          [('q', '*:*'), ('fq', 'ensemble_size:Trio')]])
+
+    def test_synthetic_queries(self):
+        catalog = [
+            'id,composer,title,collection_sorted_dictionary,' +
+            'instrumentation_dictionary,ensemble_size,special',
+            '00000001,"Absil, Jean",Fantasie,ICA,"clarinet,piano",Duet,' +
+            'Duets',
+            '00000002,"Absil, Jean",Quatuor,ICA,clarinet,Quartet,' +
+            'Quartets|Chamber',
+        ]
+
+        queries = synthetic_queries(catalog, 20, seed=1)
+        self.assertEqual(len(queries), 20)
+        self.assertEqual(queries, synthetic_queries(catalog, 20, seed=1))
+
+        for params in queries:
+            self.assertIn(params[0][1], ['*:*', 'absil', 'jean', 'fantasie',
+                                         'quatuor'])
+            for name, value in params:
+                if name == 'fq':
+                    field, value = value.split(':', 1)
+                    self.assertIn(field, facet_fields)
+                    self.assertNotIn(',', value)
+                    self.assertNotIn('|', value)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 90), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_cache_hit_ratios(self):
+        before = {'filterCache': (10, 5), 'documentCache': (100, 0)}
+        after = {'filterCache': (20, 14), 'documentCache': (10, 4),
+                 'queryResultCache': (0, 0)}
+
+        self.assertEqual(cache_hit_ratios(before, after), {
+            'filterCache': {'lookups': 10, 'hits': 9, 'hit_ratio': 0.9},
+            'documentCache': {'lookups': 10, 'hits': 4, 'hit_ratio': 0.4},
+            'queryResultCache': {'lookups': 0, 'hits': 0, 'hit_ratio': None},
+        })
+
+    def test_stub_loadtest(self):
+        stub = start_stub()
+        try:
+            queries = [[('q', 'clarinet'), ('fq', 'special:"Solos"')],
+                       [('q', 'oboe')],
+                       [('q', 'error')]]
+            results = loadtest(stub.url, queries, 30, 4, 0)
+        finally:
+            stub.shutdown()
+            stub.server_close()
+
+        self.assertEqual(results['requests'], 30)
+        self.assertEqual(results['errors'], {'HTTP 500': 10})
+        self.assertAlmostEqual(results['error_rate'], 1 / 3)
+        self.assertIsNotNone(results['latency_ms']['p99'])
+
+        caches = results['caches']
+        self.assertEqual(caches['filterCache']['lookups'], 10)
+        self.assertEqual(caches['filterCache']['hits'], 9)
+        self.assertEqual(caches['queryResultCache']['lookups'], 20)
+        self.assertEqual(caches['queryResultCache']['hits'], 18)
+
+
+if __name__ == '__main__':
+    # Setup command line arguments
+    parser = ArgumentParser()
+
+    parser.add_argument("-u", "--url", default=default_url,
+                        help=f"Solr core URL (default: {default_url})")
+
+    source = parser.add_mutually_exclusive_group(required=True)
+
+    source.add_argument("-l", "--log",
+                        type=FileType('r', encoding='UTF-8'),
+                        help="query log to replay: Solr request log, " +
+                             "/select URLs or query strings, one per line")
+
+    source.add_argument("-C", "--catalog",
+                        type=FileType('r', encoding='UTF-8'),
+                        help="cleaned CSV catalog (output of cleanup.py) " +
+                             "to build synthetic queries from")
+
+    parser.add_argument("-n", "--requests", type=int, default=1000,
+                        help="number of requests to send (default: 1000)")
+
+    parser.add_argument("-c", "--concurrency", type=int, default=4,
+                        help="number of concurrent clients (default: 4)")
+
+    parser.add_argument("-r", "--rate", type=float, default=0,
+                        help="requests per second, 0 for as fast as " +
+                             "possible (default: 0)")
+
+    parser.add_argument("-s", "--seed", type=int, default=0,
+                        help="random seed for synthetic queries (default: 0)")
+
+    parser.add_argument("--max-error-rate", type=float, default=0.0,
+                        help="exit with a status code of 1 if more than " +
+                             "this fraction of requests fail (default: 0)")
+
+    parser.add_argument("-j", "--json",
+                        type=FileType('w', encoding='UTF-8'),
+                        help="also write the results as JSON to this file")
+
+    parser.add_argument("--stub", action="store_true",
+                        help="run against a bundled local stub server " +
+                             "instead of --url")
+
+    parser.add_argument("--stub-latency", type=float, default=1.0,
+                        help="stub server latency in ms (default: 1)")
+
+    # Process command line arguments
+    args = parser.parse_args()
+
+    # Run the load test
+    main()
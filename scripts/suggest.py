@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+import sys
+import heapq
+from bisect import bisect_left
+from unittest import TestCase
+from argparse import ArgumentParser
+
+# Answer autocomplete lookups from the suggestion dictionary written by
+# cleanup.py --suggest:
+#
+# - composer, title and instrument labels, with their popularity (number of
+#   records) as weight
+# - kept in an array sorted by the case folded term, so the terms with a
+#   given prefix are a contiguous range found by binary search
+# - the top suggestions of all short prefixes are ranked in advance, since
+#   their ranges are the largest and they are typed first
+#
+# The same dictionary file is loaded by the Solr /suggest request handler.
+
+# Highest prefix length with precomputed top suggestions
+default_precompute = 3
+
+# Number of suggestions returned by default
+default_count = 10
+
+
+def read_dictionary(f):
+    '''
+    Read a suggestion dictionary, one "term<TAB>weight<TAB>source" entry per
+    line, as for the Solr FileDictionaryFactory (which has no comments).
+
+    Return a list of (term, weight, source) tuples.
+    '''
+
+    entries = []
+
+    for line in f:
+        line = line.rstrip('\n')
+        if line == '':
+            continue
+
+        term, weight, source = (line.split('\t') + ['', ''])[:3]
+        entries.append((term, int(weight or 1), source))
+
+    return entries
+
+
+class Suggester:
+    ''' Weighted prefix lookup over a sorted array of suggestions. '''
+
+    def __init__(self, entries, count=default_count,
+                 precompute=default_precompute):
+        '''
+        Build the sorted array from (term, weight, source) entries, and rank
+        the top count suggestions of all prefixes up to precompute characters.
+        '''
+
+        # Sort by key; within a key, by descending weight
+        entries = sorted((term.casefold(), -weight, term, source)
+                         for term, weight, source in entries)
+
+        self.keys = [key for key, _, _, _ in entries]
+        self.entries = [(term, -weight, source)
+                        for _, weight, term, source in entries]
+        self.count = count
+        self.precompute = precompute
+
+        # prefix -> top suggestions
+        self.top = {}
+        for length in range(0, precompute + 1):
+            start = 0
+            while start < len(self.keys):
+                prefix = self.keys[start][:length]
+                if len(prefix) < length:
+                    start += 1
+                    continue
+                end = self.find_end(prefix, start)
+                self.top[prefix] = self.rank(start, end, count)
+                start = end
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        ''' Build a Suggester from a suggestion dictionary file. '''
+
+        with open(path, encoding='UTF-8') as f:
+            return cls(read_dictionary(f), **kwargs)
+
+    def find_end(self, prefix, start):
+        ''' End of the range of keys starting with prefix, from start. '''
+
+        return bisect_left(self.keys, prefix + '\U0010ffff', start)
+
+    def rank(self, start, end, count):
+        ''' Top count entries in the range, by weight then term. '''
+
+        indexes = heapq.nsmallest(count, range(start, end),
+                                  key=lambda i: (-self.entries[i][1],
+                                                 self.keys[i]))
+        return [self.entries[i] for i in indexes]
+
+    def lookup(self, prefix, count=None):
+        '''
+        Return the top count (term, weight, source) suggestions starting with
+        prefix, ignoring case, by descending weight.
+        '''
+
+        if count is None:
+            count = self.count
+
+        prefix = prefix.casefold()
+
+        if len(prefix) <= self.precompute and count <= self.count:
+            return self.top.get(prefix, [])[:count]
+
+        start = bisect_left(self.keys, prefix)
+        return self.rank(start, self.find_end(prefix, start), count)
+
+
+class Test(TestCase):
+
+    def setUp(self):
+        self.suggester = Suggester([
+            ('Absil, Jean', 3, 'composer'),
+            ('Abbate, Luigi', 1, 'composer'),
+            ('About Time', 1, 'title'),
+            ('bassoon', 20, 'instrumentation'),
+            ('bass clarinet', 12, 'instrumentation'),
+            ('Bass Trombone Sonata', 1, 'title'),
+            ('Bach, Johann Sebastian', 40, 'composer'),
+        ], count=2, precompute=1)
+
+    def test_read_dictionary(self):
+        lines = ['Absil, Jean\t3\tcomposer\n',
+                 'bassoon\t20\n',
+                 '\n']
+
+        self.assertEqual(read_dictionary(lines),
+                         [('Absil, Jean', 3, 'composer'),
+                          ('bassoon', 20, '')])
+
+    def test_lookup_precomputed(self):
+        self.assertEqual(self.suggester.lookup(''),
+                         [('Bach, Johann Sebastian', 40, 'composer'),
+                          ('bassoon', 20, 'instrumentation')])
+
+        self.assertEqual(self.suggester.lookup('A'),
+                         [('Absil, Jean', 3, 'composer'),
+                          ('Abbate, Luigi', 1, 'composer')])
+
+        self.assertEqual(self.suggester.lookup('z'), [])
+
+    def test_lookup(self):
+        self.assertEqual(self.suggester.lookup('bass'),
+                         [('bassoon', 20, 'instrumentation'),
+                          ('bass clarinet', 12, 'instrumentation')])
+
+        self.assertEqual(self.suggester.lookup('BASS T'),
+                         [('Bass Trombone Sonata', 1, 'title')])
+
+        self.assertEqual(self.suggester.lookup('ab', count=5),
+                         [('Absil, Jean', 3, 'composer'),
+                          ('Abbate, Luigi', 1, 'composer'),
+                          ('About Time', 1, 'title')])
+
+        self.assertEqual(self.suggester.lookup('bassoons'), [])
+
+
+if __name__ == '__main__':
+    # Setup command line arguments
+    parser = ArgumentParser()
+
+    parser.add_argument("-d", "--dictionary", required=True,
+                        help="suggestion dictionary (cleanup.py --suggest)")
+
+    parser.add_argument("-n", "--count", type=int, default=default_count,
+                        help="number of suggestions " +
+                             f"(default: {default_count})")
+
+    parser.add_argument("prefix", nargs="*",
+                        help="prefixes to look up (default: one per line " +
+                             "from standard input)")
+
+    # Process command line arguments
+    args = parser.parse_args()
+
+    suggester = Suggester.load(args.dictionary, count=args.count)
+
+    # Look up each prefix
+    for prefix in args.prefix or (line.rstrip('\n') for line in sys.stdin):
+        for term, weight, source in suggester.lookup(prefix):
+            print(f'{prefix}\t{term}\t{weight}\t{source}')